@@ -1,17 +1,107 @@
-from datetime import datetime, timezone
-from sqlalchemy.orm import Session
+import asyncio
+import logging
+from sqlalchemy import delete, insert, or_, select, text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session, selectinload
 from sqlalchemy.exc import IntegrityError
 import uuid
 
-from db.db import get_session
-from db.models import Course, Section, File, User
+from db.db import async_session_scope, get_session, session_scope
+from db.models import Base, Course, Section, File, User
+
+logger = logging.getLogger(__name__)
+
+# Batches at least this large are loaded with COPY instead of INSERT
+COPY_THRESHOLD = 5_000
+
+
+def _section_rows(courseId: str, sections_data: list[dict]) -> list[dict]:
+    """Build Section insert rows for a course from section dictionaries"""
+    return [
+        {
+            "sectionId": section_data.get("sectionId"),
+            "courseId": courseId,
+            "title": section_data.get("title"),
+            "content": section_data.get("content"),
+        }
+        for section_data in sections_data
+    ]
+
+
+def _insert_rows(session: Session, model: type[Base], rows: list[dict]) -> None:
+    """
+    Insert rows of a model in the session's transaction.
+
+    Small batches go through a multi-VALUES INSERT; batches of COPY_THRESHOLD
+    rows or more are streamed with COPY, which skips per-statement parsing.
+    All rows must have the same keys.
+    """
+    if len(rows) < COPY_THRESHOLD:
+        session.execute(insert(model), rows)
+        return
+
+    columns = list(rows[0])
+    column_list = ", ".join(f'"{column}"' for column in columns)
+    dbapi_connection = session.connection().connection.dbapi_connection
+    with dbapi_connection.cursor() as cursor:
+        with cursor.copy(
+            f'COPY "{model.__tablename__}" ({column_list}) FROM STDIN'
+        ) as copy:
+            for row in rows:
+                copy.write_row([row[column] for column in columns])
+
+
+def _sync_sections(session: Session, courseIds: list[str], rows: list[dict]) -> None:
+    """
+    Make the sections of the given courses match rows: delete the sections
+    that are gone, together with their files, and upsert the rest. Rows
+    whose content did not change are not rewritten.
+    """
+    section_ids = [row["sectionId"] for row in rows]
+
+    # Drop sections that disappeared, and first the files that point at
+    # them, which would otherwise block the delete. No Section or File
+    # objects are loaded in this session, so skip synchronizing the
+    # identity map.
+    session.execute(
+        delete(File)
+        .where(File.courseId.in_(courseIds), File.sectionId.not_in(section_ids))
+        .execution_options(synchronize_session=False)
+    )
+    session.execute(
+        delete(Section)
+        .where(Section.courseId.in_(courseIds), Section.sectionId.not_in(section_ids))
+        .execution_options(synchronize_session=False)
+    )
+
+    # Upsert the rest, but only rewrite rows whose content changed
+    if rows:
+        stmt = pg_insert(Section)
+        excluded = stmt.excluded
+        session.execute(
+            stmt.on_conflict_do_update(
+                index_elements=[Section.sectionId],
+                set_={
+                    "courseId": excluded.courseId,
+                    "title": excluded.title,
+                    "content": excluded.content,
+                },
+                where=or_(
+                    Section.courseId.is_distinct_from(excluded.courseId),
+                    Section.title.is_distinct_from(excluded.title),
+                    Section.content.is_distinct_from(excluded.content),
+                ),
+            ),
+            rows,
+        )
 
 
 def add_user(
     email: str,
     password: str,
     ucl_api_token: str | None = None,
-    session: Session | None = None,
+    *,
+    session: Session,
 ) -> User | None:
     """
     Add a new user to the database.
@@ -20,42 +110,33 @@ def add_user(
         email: User email address
         password: User password
         ucl_api_token: Optional UCL API token
-        session: Optional database session. If not provided, creates a new one.
+        session: Database session. The caller commits it (see session_scope).
 
     Returns:
         The created User object, or None if creation failed
     """
-    if session is None:
-        session = get_session()
-        close_session = True
-    else:
-        close_session = False
-
     try:
-        user = User(
-            id=uuid.uuid4(),
-            email=email,
-            password=password,
-            ucl_api_token=ucl_api_token,
-        )
-        session.add(user)
-        session.commit()
-        session.refresh(user)
+        # A savepoint keeps a failed insert from rolling back the caller's work
+        with session.begin_nested():
+            user = User(
+                id=uuid.uuid4(),
+                email=email,
+                password=password,
+                ucl_api_token=ucl_api_token,
+            )
+            session.add(user)
         return user
     except IntegrityError as e:
-        session.rollback()
-        print(f"Error adding user: {e}")
+        logger.error("Error adding user: %s", e)
         return None
-    finally:
-        if close_session:
-            session.close()
 
 
 def add_course(
     userId: uuid.UUID,
     courseId: str,
     courseName: str,
-    session: Session | None = None,
+    *,
+    session: Session,
 ) -> Course | None:
     """
     Add a new course to the database.
@@ -64,7 +145,7 @@ def add_course(
         userId: ID of the user who owns this course
         courseId: Unique identifier for the course
         courseName: Name of the course
-        session: Optional database session. If not provided, creates a new one.
+        session: Database session. The caller commits it (see session_scope).
 
     Returns:
         The created Course object, or None if creation failed
@@ -72,29 +153,19 @@ def add_course(
     Raises:
         IntegrityError: If courseId already exists (unique constraint violation)
     """
-    if session is None:
-        session = get_session()
-        close_session = True
-    else:
-        close_session = False
-
     try:
-        course = Course(
-            userId=userId,
-            courseId=courseId,
-            courseName=courseName,
-        )
-        session.add(course)
-        session.commit()
-        session.refresh(course)
+        # A savepoint keeps a failed insert from rolling back the caller's work
+        with session.begin_nested():
+            course = Course(
+                userId=userId,
+                courseId=courseId,
+                courseName=courseName,
+            )
+            session.add(course)
         return course
     except IntegrityError as e:
-        session.rollback()
-        print(f"Error adding course: {e}")
+        logger.error("Error adding course: %s", e)
         return None
-    finally:
-        if close_session:
-            session.close()
 
 
 def add_section(
@@ -102,7 +173,8 @@ def add_section(
     courseId: str,
     title: str | None = None,
     content: str | None = None,
-    session: Session | None = None,
+    *,
+    session: Session,
 ) -> Section | None:
     """
     Add a new section to the database.
@@ -112,7 +184,7 @@ def add_section(
         courseId: ID of the parent course
         title: Optional title of the section
         content: Optional content of the section
-        session: Optional database session. If not provided, creates a new one.
+        session: Database session. The caller commits it (see session_scope).
 
     Returns:
         The created Section object, or None if creation failed
@@ -120,31 +192,25 @@ def add_section(
     Raises:
         IntegrityError: If sectionId already exists or if courseId doesn't exist
     """
-    if session is None:
-        session = get_session()
-        close_session = True
-    else:
-        close_session = False
-
     try:
-        section = Section(
-            sectionId=sectionId,
-            courseId=courseId,
-            title=title,
-            content=content,
-            createdAt=datetime.now(timezone.utc),
-        )
-        session.add(section)
-        session.commit()
-        session.refresh(section)
+        # A savepoint keeps a failed insert from rolling back the caller's work
+        with session.begin_nested():
+            # INSERT ... RETURNING hands back the stored row in the same round trip
+            section = session.scalars(
+                insert(Section).returning(Section),
+                [
+                    {
+                        "sectionId": sectionId,
+                        "courseId": courseId,
+                        "title": title,
+                        "content": content,
+                    }
+                ],
+            ).one()
         return section
     except IntegrityError as e:
-        session.rollback()
-        print(f"Error adding section: {e}")
+        logger.error("Error adding section: %s", e)
         return None
-    finally:
-        if close_session:
-            session.close()
 
 
 def add_file(
@@ -152,7 +218,8 @@ def add_file(
     key: str,
     courseId: str,
     sectionId: str | None = None,
-    session: Session | None = None,
+    *,
+    session: Session,
 ) -> File | None:
     """
     Add a new file to the database.
@@ -162,7 +229,7 @@ def add_file(
         key: Unique key for the file
         courseId: ID of the parent course
         sectionId: Optional ID of the parent section
-        session: Optional database session. If not provided, creates a new one.
+        session: Database session. The caller commits it (see session_scope).
 
     Returns:
         The created File object, or None if creation failed
@@ -170,31 +237,130 @@ def add_file(
     Raises:
         IntegrityError: If path or key already exists, or if courseId/sectionId don't exist
     """
-    if session is None:
-        session = get_session()
-        close_session = True
-    else:
-        close_session = False
-
     try:
-        file = File(
-            path=path,
-            key=key,
-            courseId=courseId,
-            sectionId=sectionId,
-            createdAt=datetime.now(timezone.utc),
-        )
-        session.add(file)
-        session.commit()
-        session.refresh(file)
+        # A savepoint keeps a failed insert from rolling back the caller's work
+        with session.begin_nested():
+            # INSERT ... RETURNING hands back the stored row in the same round trip
+            file = session.scalars(
+                insert(File).returning(File),
+                [
+                    {
+                        "path": path,
+                        "key": key,
+                        "courseId": courseId,
+                        "sectionId": sectionId,
+                    }
+                ],
+            ).one()
         return file
     except IntegrityError as e:
-        session.rollback()
-        print(f"Error adding file: {e}")
+        logger.error("Error adding file: %s", e)
         return None
-    finally:
-        if close_session:
-            session.close()
+
+
+def add_files_bulk(rows: list[dict], *, session: Session) -> int:
+    """
+    Add many files to the database in one batched INSERT.
+
+    Args:
+        rows: List of file dictionaries with keys:
+              'path', 'key', 'courseId', 'sectionId' (optional)
+        session: Database session. The caller commits it (see session_scope).
+
+    Returns:
+        Number of files added. Like add_file, rows whose path or key already
+        exists are skipped instead of failing the batch.
+
+    Raises:
+        IntegrityError: If a courseId/sectionId doesn't exist
+    """
+    if not rows:
+        return 0
+
+    added = session.scalars(
+        pg_insert(File).on_conflict_do_nothing().returning(File.path),
+        [
+            {
+                "path": row["path"],
+                "key": row["key"],
+                "courseId": row["courseId"],
+                "sectionId": row.get("sectionId"),
+            }
+            for row in rows
+        ],
+    ).all()
+    return len(added)
+
+
+def sync_course_files(
+    courseId: str,
+    rows: list[dict],
+    *,
+    keys: list[str] | None = None,
+    session: Session,
+) -> int:
+    """
+    Make a course's File rows match a fresh scrape.
+
+    Files of the course whose key is not in keys are deleted, then rows are
+    upserted by key, so a file that moved to another section keeps its row
+    with the new path and sectionId.
+
+    Args:
+        courseId: Course the files belong to
+        rows: List of file dictionaries for this course, see add_files_bulk.
+              If two rows share a key, the first one is kept.
+        keys: Keys of every file the course still has, including files left
+              out of rows (e.g. a failed upload whose earlier copy is still
+              in S3). Defaults to the keys in rows.
+        session: Database session. The caller commits it (see session_scope).
+
+    Returns:
+        Number of files added or changed
+
+    Raises:
+        IntegrityError: If a sectionId doesn't exist
+    """
+    # One row per key: ON CONFLICT DO UPDATE cannot touch the same row twice
+    unique_rows: dict[str, dict] = {}
+    for row in rows:
+        unique_rows.setdefault(row["key"], row)
+    if keys is None:
+        keys = list(unique_rows)
+
+    # No File objects are loaded in this session, so skip synchronizing the
+    # identity map
+    session.execute(
+        delete(File)
+        .where(File.courseId == courseId, File.key.not_in(keys))
+        .execution_options(synchronize_session=False)
+    )
+
+    if not unique_rows:
+        return 0
+
+    stmt = pg_insert(File)
+    excluded = stmt.excluded
+    changed = session.scalars(
+        stmt.on_conflict_do_update(
+            index_elements=[File.key],
+            set_={"path": excluded.path, "sectionId": excluded.sectionId},
+            where=or_(
+                File.path.is_distinct_from(excluded.path),
+                File.sectionId.is_distinct_from(excluded.sectionId),
+            ),
+        ).returning(File.path),
+        [
+            {
+                "path": row["path"],
+                "key": row["key"],
+                "courseId": courseId,
+                "sectionId": row.get("sectionId"),
+            }
+            for row in unique_rows.values()
+        ],
+    ).all()
+    return len(changed)
 
 
 def add_course_with_sections(
@@ -227,27 +393,93 @@ def add_course_with_sections(
         session.add(course)
 
         if sections_data:
-            for section_data in sections_data:
-                section = Section(
-                    sectionId=section_data.get("sectionId"),
-                    courseId=courseId,
-                    title=section_data.get("title"),
-                    content=section_data.get("content"),
-                    createdAt=datetime.now(timezone.utc),
-                )
-                session.add(section)
+            # The course row must exist before the sections referencing it
+            session.flush()
+
+            _insert_rows(session, Section, _section_rows(courseId, sections_data))
 
         session.commit()
-        session.refresh(course)
         return course
     except IntegrityError as e:
         session.rollback()
-        print(f"Error adding course with sections: {e}")
+        logger.error("Error adding course with sections: %s", e)
         return None
     finally:
         session.close()
 
 
+async def add_course_with_sections_async(
+    userId: uuid.UUID,
+    courseId: str,
+    courseName: str,
+    sections_data: list[dict] | None = None,
+) -> Course | None:
+    """
+    Async variant of add_course_with_sections using the async engine.
+
+    Args:
+        userId: ID of the user who owns this course
+        courseId: Unique identifier for the course
+        courseName: Name of the course
+        sections_data: Optional list of section dictionaries with keys:
+                      'sectionId', 'title' (optional), 'content' (optional)
+
+    Returns:
+        The created Course object, or None if creation failed
+    """
+    try:
+        async with async_session_scope() as session:
+            course = Course(
+                userId=userId,
+                courseId=courseId,
+                courseName=courseName,
+            )
+            session.add(course)
+
+            if sections_data:
+                # The course row must exist before the sections referencing it
+                await session.flush()
+                await session.execute(
+                    insert(Section), _section_rows(courseId, sections_data)
+                )
+        return course
+    except IntegrityError as e:
+        logger.error("Error adding course with sections: %s", e)
+        return None
+
+
+async def add_courses_with_sections_async(
+    userId: uuid.UUID,
+    courses_data: list[dict],
+    concurrency: int = 10,
+) -> list[Course | None]:
+    """
+    Add many courses with their sections concurrently.
+
+    Args:
+        userId: ID of the user who owns the courses
+        courses_data: List of course dictionaries with keys:
+                      'courseId', 'courseName', 'sections' (optional)
+        concurrency: Maximum number of courses written at once; keep it at or
+                     below the connection pool size
+
+    Returns:
+        The created Course objects (None for failures), in input order
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def _add(course_data: dict) -> Course | None:
+        async with semaphore:
+            return await add_course_with_sections_async(
+                userId=userId,
+                courseId=course_data["courseId"],
+                courseName=course_data["courseName"],
+                sections_data=course_data.get("sections"),
+            )
+
+    return await asyncio.gather(*(_add(course_data) for course_data in courses_data))
+
+
 def add_section_with_files(
     sectionId: str,
     courseId: str,
@@ -277,27 +509,32 @@ def add_section_with_files(
             courseId=courseId,
             title=title,
             content=content,
-            createdAt=datetime.now(timezone.utc),
         )
         session.add(section)
 
         if files_data:
-            for file_data in files_data:
-                file = File(
-                    path=file_data.get("path"),
-                    key=file_data.get("key"),
-                    courseId=courseId,
-                    sectionId=sectionId,
-                    createdAt=datetime.now(timezone.utc),
-                )
-                session.add(file)
+            # The section row must exist before the files referencing it
+            session.flush()
+
+            _insert_rows(
+                session,
+                File,
+                [
+                    {
+                        "path": file_data.get("path"),
+                        "key": file_data.get("key"),
+                        "courseId": courseId,
+                        "sectionId": sectionId,
+                    }
+                    for file_data in files_data
+                ],
+            )
 
         session.commit()
-        session.refresh(section)
         return section
     except IntegrityError as e:
         session.rollback()
-        print(f"Error adding section with files: {e}")
+        logger.error("Error adding section with files: %s", e)
         return None
     finally:
         session.close()
@@ -311,7 +548,9 @@ def add_or_update_course_with_sections(
 ) -> Course | None:
     """
     Add a new course with sections, or update if it already exists.
-    If course exists, it deletes old sections and replaces them with new ones.
+    If course exists, sections that are no longer present are deleted along
+    with their files, and the rest are upserted; rows whose title and content
+    did not change are left untouched, so re-scrapes only write what changed.
 
     Args:
         userId: ID of the user who owns this course
@@ -326,49 +565,128 @@ def add_or_update_course_with_sections(
     session = get_session()
 
     try:
-        # Check if course already exists
-        existing_course = (
-            session.query(Course).filter(Course.courseId == courseId).first()
+        # Serialize concurrent syncs of the same course for this transaction
+        session.execute(
+            text("SELECT pg_advisory_xact_lock(hashtext(:k))"),
+            {"k": f"course:{courseId}"},
         )
 
-        if existing_course:
-            # Update existing course
-            existing_course.courseName = courseName
-            existing_course.userId = userId
-
-            # Delete old sections (cascade will delete associated files)
-            session.query(Section).filter(Section.courseId == courseId).delete()
-
-            course = existing_course
-            print(f"✓ Updating existing course: {courseId}")
-        else:
-            # Create new course
-            course = Course(
-                userId=userId,
-                courseId=courseId,
-                courseName=courseName,
+        # Insert the course, or update it in place if it already exists
+        upsert = (
+            pg_insert(Course)
+            .values(userId=userId, courseId=courseId, courseName=courseName)
+            .on_conflict_do_update(
+                index_elements=[Course.courseId],
+                set_={"userId": userId, "courseName": courseName},
             )
-            session.add(course)
-            print(f"✓ Creating new course: {courseId}")
+            .returning(Course)
+        )
+        course = session.execute(
+            upsert, execution_options={"populate_existing": True}
+        ).scalar_one()
+        logger.debug("Upserted course: %s", courseId)
 
-        # Add sections
-        if sections_data:
-            for section_data in sections_data:
-                section = Section(
-                    sectionId=section_data.get("sectionId"),
-                    courseId=courseId,
-                    title=section_data.get("title"),
-                    content=section_data.get("content"),
-                    createdAt=datetime.now(timezone.utc),
-                )
-                session.add(section)
+        _sync_sections(
+            session, [courseId], _section_rows(courseId, sections_data or [])
+        )
 
         session.commit()
-        session.refresh(course)
         return course
     except Exception as e:
         session.rollback()
-        print(f"Error adding or updating course with sections: {e}")
+        logger.error("Error adding or updating course with sections: %s", e)
         return None
     finally:
         session.close()
+
+
+def bulk_sync_courses(userId: uuid.UUID, courses: list[dict]) -> list[Course] | None:
+    """
+    Add or update many courses and their sections in a single transaction.
+    Like add_or_update_course_with_sections, but the course upsert and the
+    section sync each run once for the whole batch. If a courseId appears
+    more than once, the last entry wins.
+
+    Args:
+        userId: ID of the user who owns these courses
+        courses: List of course dictionaries with keys:
+                 'courseId', 'courseName', 'sections' (optional list of
+                 section dictionaries, see add_or_update_course_with_sections)
+
+    Returns:
+        The created or updated Course objects, or None if the sync failed
+    """
+    if not courses:
+        return []
+
+    # One row per course: a multi-row ON CONFLICT DO UPDATE cannot touch
+    # the same row twice
+    courses = list({c["courseId"]: c for c in courses}.values())
+    courseIds = [c["courseId"] for c in courses]
+
+    try:
+        with session_scope() as session:
+            # Lock in a fixed order so overlapping batches cannot deadlock
+            for courseId in sorted(courseIds):
+                session.execute(
+                    text("SELECT pg_advisory_xact_lock(hashtext(:k))"),
+                    {"k": f"course:{courseId}"},
+                )
+
+            stmt = pg_insert(Course).values(
+                [
+                    {
+                        "userId": userId,
+                        "courseId": c["courseId"],
+                        "courseName": c["courseName"],
+                    }
+                    for c in courses
+                ]
+            )
+            upsert = stmt.on_conflict_do_update(
+                index_elements=[Course.courseId],
+                set_={
+                    "userId": stmt.excluded.userId,
+                    "courseName": stmt.excluded.courseName,
+                },
+            ).returning(Course)
+            synced = list(
+                session.scalars(upsert, execution_options={"populate_existing": True})
+            )
+
+            _sync_sections(
+                session,
+                courseIds,
+                [
+                    row
+                    for c in courses
+                    for row in _section_rows(c["courseId"], c.get("sections") or [])
+                ],
+            )
+
+        logger.debug("Synced %d courses", len(synced))
+        return synced
+    except Exception as e:
+        logger.error("Error syncing courses: %s", e)
+        return None
+
+
+def get_course_full(courseId: str, *, session: Session) -> Course | None:
+    """
+    Load a course together with its sections and files.
+
+    Each relationship is fetched with one extra SELECT ... IN query, so the
+    cost does not grow with the number of sections or files.
+
+    Args:
+        courseId: Unique identifier for the course
+        session: Database session
+
+    Returns:
+        The Course object with sections and files loaded, or None if not found
+    """
+    return session.execute(
+        select(Course)
+        .where(Course.courseId == courseId)
+        .options(selectinload(Course.sections), selectinload(Course.files))
+    ).scalar_one_or_none()
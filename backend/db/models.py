@@ -1,10 +1,20 @@
-from datetime import datetime, timezone
-from sqlalchemy import String, Text, ForeignKey, DateTime, UniqueConstraint, UUID
-from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import relationship, Mapped, mapped_column
+from datetime import datetime
+from sqlalchemy import (
+    String,
+    Text,
+    ForeignKey,
+    DateTime,
+    Index,
+    UniqueConstraint,
+    UUID,
+    func,
+)
+from sqlalchemy.orm import DeclarativeBase, relationship, Mapped, mapped_column
 import uuid
 
-Base = declarative_base()
+
+class Base(DeclarativeBase):
+    pass
 
 
 class User(Base):
@@ -46,11 +56,13 @@ class Course(Base):
 
     # Relationships
     user: Mapped["User"] = relationship("User", back_populates="courses")
+    # lazy="raise" turns accidental per-row lazy loads (N+1) into errors;
+    # load these explicitly, e.g. with selectinload
     sections: Mapped[list["Section"]] = relationship(
-        "Section", back_populates="course", cascade="all, delete-orphan"
+        "Section", back_populates="course", cascade="all, delete-orphan", lazy="raise"
     )
     files: Mapped[list["File"]] = relationship(
-        "File", back_populates="course", cascade="all, delete-orphan"
+        "File", back_populates="course", cascade="all, delete-orphan", lazy="raise"
     )
 
     def __repr__(self) -> str:
@@ -74,12 +86,17 @@ class Section(Base):
     title: Mapped[str | None] = mapped_column(String(255), nullable=True)
     createdAt: Mapped[datetime] = mapped_column(
         DateTime(timezone=True),
-        default=lambda: datetime.now(timezone.utc),
+        server_default=func.now(),
         nullable=False,
     )
 
+    # PostgreSQL does not index foreign key columns on its own
+    __table_args__: tuple[Index, ...] = (Index("ix_section_courseId", "courseId"),)
+
     # Relationships
-    course: Mapped["Course"] = relationship("Course", back_populates="sections")
+    course: Mapped["Course"] = relationship(
+        "Course", back_populates="sections", lazy="raise"
+    )
 
     def __repr__(self) -> str:
         return (
@@ -101,10 +118,15 @@ class File(Base):
     )
     createdAt: Mapped[datetime] = mapped_column(
         DateTime(timezone=True),
-        default=lambda: datetime.now(timezone.utc),
+        server_default=func.now(),
         nullable=False,
     )
 
+    __table_args__: tuple[Index, ...] = (
+        Index("ix_file_courseId", "courseId"),
+        Index("ix_file_sectionId", "sectionId"),
+    )
+
     # Relationships
     course: Mapped["Course"] = relationship("Course", back_populates="files")
 
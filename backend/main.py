@@ -1,26 +1,55 @@
 import asyncio
-from flask import Flask, jsonify, render_template, request, redirect
-from flask_cors import CORS
-from playwright.async_api import async_playwright
-import json
+from cachetools import TTLCache
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Header, Request
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, RedirectResponse
+import httpx
+from playwright.async_api import Browser, Playwright, async_playwright
 from scraper import scrape
 import webbrowser
-from utils.get_room import get_free_rooms
-from utils.get_timetable import get_personal_timetable
-import requests
-from requests import Response
+from utils.get_room import get_free_rooms_async
+from utils.get_timetable import get_personal_timetable_async
+from utils.uclapi import build_params
 import os
 from dotenv import load_dotenv
 import uuid
+import secrets
 import subprocess
+import time
 
 load_dotenv()
 
 start_time = "2025-11-07T00:00:00Z"
 end_time = "2025-11-09T00:00:00Z"
-client_secret = os.getenv("CLIENT_SECRET")
-client_id = os.getenv("CLIENT_ID")
-token = ""
+
+# Pending UCL API logins: opaque OAuth state -> user_id, valid for 10 minutes
+_oauth_states: TTLCache = TTLCache(maxsize=1024, ttl=600)
+# UCL API tokens per user: user_id -> (session, token, expires_at). The session
+# secret is handed to the caller by /callback and must accompany every lookup.
+_tokens: dict[uuid.UUID, tuple[str, str, float]] = {}
+
+# Shared HTTP client for outbound API calls, opened in the app lifespan
+httpx_client: httpx.AsyncClient | None = None
+
+# Playwright driver, started in the app lifespan
+_playwright: Playwright | None = None
+# Long-lived browser for the Moodle login, launched on first use and shared by
+# every request; each login gets its own isolated context
+_login_browser: Browser | None = None
+# Headless browser shared by all scrape jobs, launched in the app lifespan and
+# relaunched if it crashes; each job gets its own isolated context
+_scrape_browser: Browser | None = None
+_login_browser_lock = asyncio.Lock()
+_scrape_browser_lock = asyncio.Lock()
+
+# Background scrape jobs by id. Held in process memory, so the app runs as
+# a single uvicorn worker (see Procfile). Running jobs are kept until they
+# finish; finished ones stay pollable for an hour, then expire.
+_scrape_jobs: dict[str, dict] = {}
+_finished_scrape_jobs: TTLCache = TTLCache(maxsize=1024, ttl=3600)
+# Strong references to running job tasks so they are not garbage collected
+_scrape_tasks: set[asyncio.Task] = set()
 
 
 def ensure_playwright_browsers():
@@ -46,83 +75,228 @@ def ensure_playwright_browsers():
         print(f"Warning: Failed to ensure Playwright browsers: {e}")
 
 
-app = Flask(__name__)
-CORS(app)
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global httpx_client, _playwright
+    # HTTP/2 lets the OAuth, room and timetable calls to UCL API share a connection
+    httpx_client = httpx.AsyncClient(timeout=30, http2=True)
+    _playwright = await async_playwright().start()
+    await _get_scrape_browser()
+    try:
+        yield
+    finally:
+        await httpx_client.aclose()
+        if _scrape_browser is not None:
+            await _scrape_browser.close()
+        if _login_browser is not None:
+            await _login_browser.close()
+        if _playwright is not None:
+            await _playwright.stop()
+
+
+app = FastAPI(lifespan=lifespan)
+app.add_middleware(
+    CORSMiddleware, allow_origins=["*"], allow_methods=["*"], allow_headers=["*"]
+)
 
 # Production flag - set to True when running in production
 PRODUCTION = os.getenv("ENVIRONMENT", "development") == "production"
 
+# Chromium flags that trim memory use so more contexts fit per host
+CHROMIUM_ARGS = [
+    "--no-sandbox",
+    "--disable-dev-shm-usage",
+    "--disable-gpu",
+    "--disable-extensions",
+]
+
 # Ensure Playwright browsers are installed at app startup
 ensure_playwright_browsers()
 
 
-@app.route("/login")
-def uclapi_login():
-    url = "https://uclapi.com/oauth/authorise/?client_id=2816741881293921.8225769007143823&state=1"
+@app.get("/login")
+async def uclapi_login(user_id: str):
+    try:
+        user_id = uuid.UUID(user_id)
+    except ValueError:
+        return JSONResponse(
+            {"status": "error", "error": "user_id must be a valid UUID"},
+            status_code=400,
+        )
+    # An unguessable state stands in for the user id, so the callback can only
+    # be completed for a login that actually started here
+    state = secrets.token_urlsafe(32)
+    _oauth_states[state] = user_id
+    url = f"https://uclapi.com/oauth/authorise/?client_id=2816741881293921.8225769007143823&state={state}"
     webbrowser.open_new(url)
-    return redirect(url)
+    return RedirectResponse(url, status_code=302)
 
 
-@app.route("/callback")
-def receive_callback():
-    # receive parameters
-    result = request.args.get("result", "")
-    code = request.args.get("code", "")
-    state = request.args.get("state", "")
+@app.get("/callback")
+async def receive_callback(result: str = "", code: str = "", state: str = ""):
+    user_id = _oauth_states.pop(state, None)
+    if user_id is None:
+        return JSONResponse(
+            {"status": "error", "error": "unknown or expired login state"},
+            status_code=400,
+        )
 
     # e.g. request an auth token from /oauth/tokem
-    params: dict = {
-        "code": code,
-        "client_id": client_id,
-        "client_secret": client_secret,
-    }
-    response: Response = requests.get("https://uclapi.com/oauth/token", params=params)
+    params = build_params({"code": code})
+    response: httpx.Response = await httpx_client.get(
+        "https://uclapi.com/oauth/token", params=params
+    )
     token_result: dict = response.json()
     token = token_result["token"]
-    return jsonify({"token": token})
+    session = secrets.token_urlsafe(32)
+    # Treat the token as expired a little early to avoid racing the server
+    _tokens[user_id] = (
+        session,
+        token,
+        time.time() + token_result.get("expires_in", 3600) - 30,
+    )
+    return {"session": session}
 
 
-@app.route("/scrape", methods=["POST"])
-def capture_moodle_cookies():
+def _get_token(user_id: str, session: str | None) -> str | None:
+    """Return the cached, unexpired UCL API token for a user, if the caller
+    holds the session issued with it"""
+    try:
+        user_id = uuid.UUID(user_id)
+    except ValueError:
+        return None
+    entry = _tokens.get(user_id)
+    if entry is None:
+        return None
+    expected_session, token, expires_at = entry
+    if time.time() >= expires_at:
+        _tokens.pop(user_id, None)
+        return None
+    if session is None or not secrets.compare_digest(session, expected_session):
+        return None
+    return token
+
+
+def _login_required() -> JSONResponse:
+    return JSONResponse(
+        {"status": "error", "error": "no valid UCL API token, log in again"},
+        status_code=401,
+    )
+
+
+@app.get("/room_results")
+async def room_results(
+    user_id: str,
+    start: str = start_time,
+    end: str = end_time,
+    session: str | None = Header(default=None, alias="X-Session"),
+):
+    """Free rooms between start and end, using the user's cached token"""
+    token = _get_token(user_id, session)
+    if token is None:
+        return _login_required()
+    return await get_free_rooms_async(start, end, token, httpx_client)
+
+
+@app.get("/timetable_results")
+async def timetable_results(
+    user_id: str,
+    date: str = "",
+    session: str | None = Header(default=None, alias="X-Session"),
+):
+    """Personal timetable, optionally for one date, using the user's cached token"""
+    token = _get_token(user_id, session)
+    if token is None:
+        return _login_required()
+    return await get_personal_timetable_async(token, httpx_client, date)
+
+
+@app.post("/scrape")
+async def capture_moodle_cookies(request: Request):
     """Open browser for user to login to UCL Moodle and capture cookies"""
     try:
         # Get user_id from request JSON body
-        data = request.get_json()
+        data = await request.json()
         user_id_str = data.get("user_id") if data else None
 
         if not user_id_str:
-            return jsonify({"status": "error", "error": "user_id is required"}), 400
+            return JSONResponse(
+                {"status": "error", "error": "user_id is required"}, status_code=400
+            )
 
         # Validate and convert user_id to UUID
         try:
             user_id = uuid.UUID(user_id_str)
         except (ValueError, TypeError):
-            return jsonify(
-                {"status": "error", "error": "user_id must be a valid UUID"}
-            ), 400
+            return JSONResponse(
+                {"status": "error", "error": "user_id must be a valid UUID"},
+                status_code=400,
+            )
 
-        # Run the async function in an event loop
-        cookies = asyncio.run(_capture_cookies_async())
+        # Run the login and scrape in the background and hand back a job id
+        job_id = str(uuid.uuid4())
+        _scrape_jobs[job_id] = {"status": "running"}
+        task = asyncio.create_task(_do_scrape(job_id, user_id))
+        _scrape_tasks.add(task)
+        task.add_done_callback(_scrape_tasks.discard)
 
-        # Run the scraping in the same event loop
-        asyncio.run(scrape(cookies, user_id))
+        return JSONResponse({"status": "accepted", "job_id": job_id}, status_code=202)
 
-        return jsonify(
-            {
-                "status": "success",
-            }
+    except Exception as e:
+        return JSONResponse({"status": "error", "error": str(e)}, status_code=500)
+
+
+@app.get("/scrape/{job_id}")
+async def get_scrape_status(job_id: str):
+    """Return the status of a background scrape job"""
+    job = _scrape_jobs.get(job_id) or _finished_scrape_jobs.get(job_id)
+    if job is None:
+        return JSONResponse(
+            {"status": "error", "error": "unknown job_id"}, status_code=404
         )
+    return {"job_id": job_id, **job}
+
+
+async def _do_scrape(job_id: str, user_id: uuid.UUID):
+    """Capture Moodle cookies, scrape, and record the outcome on the job"""
+    try:
+        cookies = await _capture_cookies_async()
+
+        await scrape(cookies, user_id, browser=await _get_scrape_browser())
 
+        result = {"status": "success"}
     except Exception as e:
-        return jsonify({"status": "error", "error": str(e)}), 500
+        result = {"status": "error", "error": str(e)}
+    _finished_scrape_jobs[job_id] = result
+    _scrape_jobs.pop(job_id, None)
+
+
+async def _get_login_browser() -> Browser:
+    """Return the shared login browser, launching it if needed"""
+    global _login_browser
+    async with _login_browser_lock:
+        if _login_browser is None or not _login_browser.is_connected():
+            # Use headless mode in production, interactive in development
+            _login_browser = await _playwright.chromium.launch(
+                headless=PRODUCTION, args=CHROMIUM_ARGS
+            )
+        return _login_browser
+
+
+async def _get_scrape_browser() -> Browser:
+    """Return the shared headless scrape browser, relaunching it if needed"""
+    global _scrape_browser
+    async with _scrape_browser_lock:
+        if _scrape_browser is None or not _scrape_browser.is_connected():
+            _scrape_browser = await _playwright.chromium.launch(args=CHROMIUM_ARGS)
+        return _scrape_browser
 
 
 async def _capture_cookies_async():
     """Async function to capture cookies from Moodle login"""
-    async with async_playwright() as p:
-        # Use headless mode in production, interactive in development
-        browser = await p.chromium.launch(headless=False)
-        context = await browser.new_context()
+    browser = await _get_login_browser()
+    context = await browser.new_context()
+    try:
         page = await context.new_page()
 
         # Navigate to UCL Moodle
@@ -131,15 +305,31 @@ async def _capture_cookies_async():
         # Wait for user to login (wait for dashboard to load)
         await page.wait_for_url("**/my/", timeout=300000)  # 5 min timeout
 
-        # Capture cookies and user agent
-        cookies = await context.cookies()
-
-        await browser.close()
+        # Keep only the Moodle cookies, and only the fields add_cookies needs
+        cookies = [
+            {
+                "name": c["name"],
+                "value": c["value"],
+                "domain": c["domain"],
+                "path": c["path"],
+            }
+            for c in await context.cookies()
+            if "moodle.ucl.ac.uk" in c.get("domain", "")
+        ]
 
         return cookies
+    finally:
+        await context.close()
 
 
 if __name__ == "__main__":
-    # In production, use gunicorn (via Procfile)
-    # In development, use Flask's built-in server
-    app.run(debug=not PRODUCTION, host="0.0.0.0", port=int(os.getenv("PORT", 3001)))
+    # In production, use uvicorn workers (via Procfile)
+    # In development, run a single reloading uvicorn server
+    import uvicorn
+
+    uvicorn.run(
+        "main:app",
+        host="0.0.0.0",
+        port=int(os.getenv("PORT", 3001)),
+        reload=not PRODUCTION,
+    )
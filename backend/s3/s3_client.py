@@ -3,10 +3,17 @@ S3 client module for uploading files to S3-compatible storage services.
 Supports AWS S3, MinIO, and other S3-compatible providers.
 """
 
+import asyncio
+import functools
+from datetime import datetime
+import io
+import mimetypes
 import os
 import logging
-from typing import Optional, Any
+from typing import BinaryIO, Optional, Any
 import boto3
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
 from botocore.exceptions import ClientError
 
 
@@ -14,6 +21,33 @@ logger = logging.getLogger(__name__)
 
 MOODLE_URL: str = "https://moodle.ucl.ac.uk"
 
+mimetypes.init()
+
+# MIME types of the files the Moodle scraper usually uploads; anything else
+# falls back to mimetypes
+_EXT_TO_MIME: dict[str, str] = {
+    ".pdf": "application/pdf",
+    ".html": "text/html",
+    ".htm": "text/html",
+    ".json": "application/json",
+    ".png": "image/png",
+    ".jpg": "image/jpeg",
+    ".jpeg": "image/jpeg",
+    ".docx": "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+    ".pptx": "application/vnd.openxmlformats-officedocument.presentationml.presentation",
+    ".zip": "application/zip",
+}
+
+# Objects above the threshold are uploaded in parallel multipart chunks
+MULTIPART_THRESHOLD: int = 8 * 1024 * 1024
+MULTIPART_CHUNKSIZE: int = 16 * 1024 * 1024
+
+# Upload integrity checksum to request explicitly, e.g. "CRC32" or "CRC32C"
+# (the latter needs boto3[crt]). Unset by default: some S3-compatible
+# endpoints reject x-amz-checksum headers, and botocore already adds one
+# where supported (see AWS_REQUEST_CHECKSUM_CALCULATION).
+CHECKSUM_ALGORITHM: Optional[str] = os.getenv("AWS_S3_CHECKSUM_ALGORITHM") or None
+
 
 class S3Client:
     """Client for interacting with S3-compatible storage services."""
@@ -49,13 +83,26 @@ class S3Client:
         if not self.bucket_name:
             raise ValueError("AWS_S3_BUCKET_NAME must be provided")
 
-        # Initialize S3 client
-        self.client: Any = boto3.client(
-            "s3",
-            aws_access_key_id=self.access_key,
-            aws_secret_access_key=self.secret_key,
-            endpoint_url=self.endpoint_url,
-            region_name=self.region_name,
+        # Object URLs are this prefix followed by the object name
+        self._url_prefix: str = (
+            # For custom endpoints (MinIO, etc.)
+            f"{self.endpoint_url}/{self.bucket_name}/"
+            if self.endpoint_url
+            # For AWS S3
+            else f"https://{self.bucket_name}.s3.{self.region_name}.amazonaws.com/"
+        )
+
+        # Initialize S3 client, shared by clients with the same credentials
+        self.client: Any = _make_boto_client(
+            self.access_key, self.secret_key, self.endpoint_url, self.region_name
+        )
+
+        # Shared settings for managed (multipart-capable) transfers
+        self._transfer_cfg: TransferConfig = TransferConfig(
+            multipart_threshold=MULTIPART_THRESHOLD,
+            multipart_chunksize=MULTIPART_CHUNKSIZE,
+            max_concurrency=10,
+            use_threads=True,
         )
 
     def upload_file(
@@ -65,10 +112,6 @@ class S3Client:
         content_type: Optional[str] = None,
     ) -> dict[str, Any]:
         try:
-            # Validate file exists
-            if not os.path.exists(file_path):
-                raise FileNotFoundError(f"File not found: {file_path}")
-
             # Use filename if object_name not provided
             if object_name is None:
                 object_name = os.path.basename(file_path)
@@ -77,13 +120,30 @@ class S3Client:
             if content_type is None:
                 content_type = self._get_content_type(file_path)
 
-            # Upload file
-            self.client.upload_file(
-                file_path,
-                self.bucket_name,
-                object_name,
-                ExtraArgs={"ContentType": content_type} if content_type else {},
-            )
+            extra_args: dict[str, Any] = {}
+            if CHECKSUM_ALGORITHM:
+                extra_args["ChecksumAlgorithm"] = CHECKSUM_ALGORITHM
+            if content_type:
+                extra_args["ContentType"] = content_type
+
+            # open() raises FileNotFoundError itself, so no separate exists check.
+            # Upload small files with a single PUT, large ones in multipart chunks.
+            with open(file_path, "rb") as f:
+                if os.fstat(f.fileno()).st_size < MULTIPART_THRESHOLD:
+                    self.client.put_object(
+                        Bucket=self.bucket_name,
+                        Key=object_name,
+                        Body=f,
+                        **extra_args,
+                    )
+                else:
+                    self.client.upload_fileobj(
+                        f,
+                        self.bucket_name,
+                        object_name,
+                        ExtraArgs=extra_args,
+                        Config=self._transfer_cfg,
+                    )
 
             # Generate URL
             url = self._generate_url(object_name)
@@ -98,7 +158,7 @@ class S3Client:
         except FileNotFoundError as e:
             raise FileNotFoundError(f"Cannot upload file: {e}")
         except Exception as e:
-            logger.error(f"S3 upload error: {e}")
+            logger.error("S3 upload error: %s", e)
             raise
 
     def upload_file_from_bytes(
@@ -123,15 +183,27 @@ class S3Client:
         """
         try:
             extra_args: dict[str, Any] = {}
+            if CHECKSUM_ALGORITHM:
+                extra_args["ChecksumAlgorithm"] = CHECKSUM_ALGORITHM
             if content_type:
                 extra_args["ContentType"] = content_type
 
-            self.client.put_object(
-                Bucket=self.bucket_name,
-                Key=object_name,
-                Body=file_bytes,
-                **extra_args,
-            )
+            # Upload small payloads with a single PUT, large ones in multipart chunks
+            if len(file_bytes) < MULTIPART_THRESHOLD:
+                self.client.put_object(
+                    Bucket=self.bucket_name,
+                    Key=object_name,
+                    Body=file_bytes,
+                    **extra_args,
+                )
+            else:
+                self.client.upload_fileobj(
+                    io.BytesIO(file_bytes),
+                    self.bucket_name,
+                    object_name,
+                    ExtraArgs=extra_args,
+                    Config=self._transfer_cfg,
+                )
 
             url = self._generate_url(object_name)
 
@@ -143,9 +215,106 @@ class S3Client:
             }
 
         except Exception as e:
-            logger.error(f"S3 upload error: {e}")
+            logger.error("S3 upload error: %s", e)
             raise
 
+    def upload_fileobj(
+        self,
+        fileobj: BinaryIO,
+        object_name: str,
+        content_type: Optional[str] = None,
+    ) -> dict[str, Any]:
+        """
+        Upload a seekable binary file object to S3 bucket, from its current
+        position to the end.
+
+        Args:
+            fileobj: Seekable file object opened in binary mode
+            object_name: S3 object name
+            content_type: MIME type of the file; guessed from object_name if None
+
+        Returns:
+            Dictionary with 'success' status, 's3_key', and 'url'
+
+        Raises:
+            ClientError: If S3 operation fails
+        """
+        try:
+            if content_type is None:
+                content_type = self._get_content_type(object_name)
+
+            extra_args: dict[str, Any] = {}
+            if CHECKSUM_ALGORITHM:
+                extra_args["ChecksumAlgorithm"] = CHECKSUM_ALGORITHM
+            if content_type:
+                extra_args["ContentType"] = content_type
+
+            # Size what is left to read without reading it
+            start = fileobj.tell()
+            size = fileobj.seek(0, io.SEEK_END) - start
+            fileobj.seek(start)
+
+            # Upload small files with a single PUT, large ones in multipart chunks
+            if size < MULTIPART_THRESHOLD:
+                self.client.put_object(
+                    Bucket=self.bucket_name,
+                    Key=object_name,
+                    Body=fileobj,
+                    **extra_args,
+                )
+            else:
+                self.client.upload_fileobj(
+                    fileobj,
+                    self.bucket_name,
+                    object_name,
+                    ExtraArgs=extra_args,
+                    Config=self._transfer_cfg,
+                )
+
+            url = self._generate_url(object_name)
+
+            return {
+                "success": True,
+                "s3_key": object_name,
+                "url": url,
+                "bucket": self.bucket_name,
+            }
+
+        except Exception as e:
+            logger.error("S3 upload error: %s", e)
+            raise
+
+    async def upload_many(
+        self,
+        items: list[tuple[bytes, str, Optional[str]]],
+        concurrency: int = 16,
+    ) -> list[dict[str, Any]]:
+        """
+        Upload many files from bytes concurrently.
+
+        Args:
+            items: List of (file_bytes, object_name, content_type) tuples
+            concurrency: Maximum number of uploads in flight; keep it at or
+                         below the client's connection pool size (50)
+
+        Returns:
+            List of upload results (see upload_file_from_bytes), in input order
+
+        Raises:
+            ClientError: If any S3 operation fails
+        """
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def _upload_one(
+            file_bytes: bytes, object_name: str, content_type: Optional[str]
+        ) -> dict[str, Any]:
+            async with semaphore:
+                return await asyncio.to_thread(
+                    self.upload_file_from_bytes, file_bytes, object_name, content_type
+                )
+
+        return await asyncio.gather(*(_upload_one(*item) for item in items))
+
     def download_file(
         self,
         object_name: str,
@@ -168,7 +337,11 @@ class S3Client:
             # Create directory if it doesn't exist
             os.makedirs(os.path.dirname(file_path), exist_ok=True)
 
-            self.client.download_file(self.bucket_name, object_name, file_path)
+            # Objects above the multipart threshold are fetched as parallel
+            # ranged GETs; smaller ones stay a single GET
+            self.client.download_file(
+                self.bucket_name, object_name, file_path, Config=self._transfer_cfg
+            )
 
             return {
                 "success": True,
@@ -177,7 +350,31 @@ class S3Client:
             }
 
         except Exception as e:
-            logger.error(f"S3 download error: {e}")
+            logger.error("S3 download error: %s", e)
+            raise
+
+    def download_file_to_bytes(self, object_name: str) -> bytes:
+        """
+        Download a file from S3 bucket into memory.
+
+        Args:
+            object_name: S3 object name
+
+        Returns:
+            File content as bytes
+
+        Raises:
+            ClientError: If S3 operation fails
+        """
+        try:
+            buffer = io.BytesIO()
+            self.client.download_fileobj(
+                self.bucket_name, object_name, buffer, Config=self._transfer_cfg
+            )
+            return buffer.getvalue()
+
+        except Exception as e:
+            logger.error("S3 download error: %s", e)
             raise
 
     def delete_file(self, object_name: str) -> dict[str, Any]:
@@ -203,7 +400,7 @@ class S3Client:
             }
 
         except Exception as e:
-            logger.error(f"S3 delete error: {e}")
+            logger.error("S3 delete error: %s", e)
             raise
 
     def list_objects(self, prefix: str = "") -> dict[str, Any]:
@@ -214,36 +411,39 @@ class S3Client:
             prefix: Prefix to filter objects
 
         Returns:
-            Dictionary with 'success' status and list of objects
+            Dictionary with 'success' status, 'count', and parallel lists
+            'keys', 'sizes' and 'last_modified' (datetimes), one entry per object
 
         Raises:
             ClientError: If S3 operation fails
         """
         try:
-            response: dict[str, Any] = self.client.list_objects_v2(
+            keys: list[str] = []
+            sizes: list[int] = []
+            last_modified: list[datetime] = []
+
+            # Follow continuation tokens past the 1000-key page limit
+            paginator = self.client.get_paginator("list_objects_v2")
+            for page in paginator.paginate(
                 Bucket=self.bucket_name,
                 Prefix=prefix,
-            )
-
-            objects: list[dict[str, Any]] = []
-            if "Contents" in response:
-                objects = [
-                    {
-                        "key": obj["Key"],
-                        "size": obj["Size"],
-                        "last_modified": obj["LastModified"].isoformat(),
-                    }
-                    for obj in response["Contents"]
-                ]
+                PaginationConfig={"PageSize": 1000},
+            ):
+                for obj in page.get("Contents", ()):
+                    keys.append(obj["Key"])
+                    sizes.append(obj["Size"])
+                    last_modified.append(obj["LastModified"])
 
             return {
                 "success": True,
-                "objects": objects,
-                "count": len(objects),
+                "keys": keys,
+                "sizes": sizes,
+                "last_modified": last_modified,
+                "count": len(keys),
             }
 
         except Exception as e:
-            logger.error(f"S3 list error: {e}")
+            logger.error("S3 list error: %s", e)
             raise
 
     def _generate_url(self, object_name: str) -> str:
@@ -256,12 +456,7 @@ class S3Client:
         Returns:
             URL to the object
         """
-        if self.endpoint_url:
-            # For custom endpoints (MinIO, etc.)
-            return f"{self.endpoint_url}/{self.bucket_name}/{object_name}"
-        else:
-            # For AWS S3
-            return f"https://{self.bucket_name}.s3.{self.region_name}.amazonaws.com/{object_name}"
+        return self._url_prefix + object_name
 
     @staticmethod
     def _get_content_type(file_path: str) -> str:
@@ -274,10 +469,9 @@ class S3Client:
         Returns:
             MIME type string
         """
-        import mimetypes
-
-        mime_type, _ = mimetypes.guess_type(file_path)
-        return mime_type or "application/octet-stream"
+        file_name = os.path.basename(file_path)
+        extension = os.path.splitext(file_name)[1].lower()
+        return _EXT_TO_MIME.get(extension) or _guess_content_type(file_name)
 
     def get_presigned_url(
         self,
@@ -305,7 +499,7 @@ class S3Client:
             )
             return url
         except Exception as e:
-            logger.error(f"S3 presigned URL error: {e}")
+            logger.error("S3 presigned URL error: %s", e)
             raise
 
     def file_exists(self, object_name: str) -> bool:
@@ -321,15 +515,86 @@ class S3Client:
         try:
             self.client.head_object(Bucket=self.bucket_name, Key=object_name)
             return True
-        except Exception as e:
-            logger.debug(f"File existence check: {e}")
-            return False
+        except ClientError as e:
+            if e.response["Error"]["Code"] in ("404", "NoSuchKey", "NotFound"):
+                return False
+            raise
 
+    def files_exist(self, object_names: list[str]) -> dict[str, bool]:
+        """
+        Check which of several files exist in S3, with one listing per folder.
 
-# Singleton instance for easy access
-_s3_client: Optional[S3Client] = None
+        Keys are grouped by their parent folder and each folder is listed
+        once; a folder nested in another listed folder is covered by it.
+        Keys without a folder are checked one by one, so the whole bucket is
+        never listed.
 
+        Args:
+            object_names: S3 object names
 
+        Returns:
+            Dictionary mapping each object name to whether it exists
+
+        Raises:
+            ClientError: If S3 operation fails
+        """
+        folders: set[str] = set()
+        loose: list[str] = []
+        for name in object_names:
+            folder, sep, _ = name.rpartition("/")
+            if folder:
+                folders.add(folder + sep)
+            else:
+                loose.append(name)
+
+        prefixes: list[str] = []
+        for folder in sorted(folders):
+            if not (prefixes and folder.startswith(prefixes[-1])):
+                prefixes.append(folder)
+
+        paginator = self.client.get_paginator("list_objects_v2")
+        existing: set[str] = {
+            obj["Key"]
+            for prefix in prefixes
+            for page in paginator.paginate(Bucket=self.bucket_name, Prefix=prefix)
+            for obj in page.get("Contents", ())
+        }
+        existing.update(name for name in loose if self.file_exists(name))
+        return {name: name in existing for name in object_names}
+
+
+@functools.lru_cache(maxsize=4096)
+def _guess_content_type(file_name: str) -> str:
+    """Guess the MIME type for a file name with mimetypes, cached"""
+    # Whole name, so multi-suffix names like .tar.gz are recognised
+    mime_type, _ = mimetypes.guess_type(file_name)
+    return mime_type or "application/octet-stream"
+
+
+@functools.lru_cache(maxsize=8)
+def _make_boto_client(
+    access_key: str,
+    secret_key: str,
+    endpoint_url: Optional[str],
+    region_name: str,
+) -> Any:
+    """Create a boto3 S3 client, cached since boto3 clients are thread-safe"""
+    return boto3.client(
+        "s3",
+        aws_access_key_id=access_key,
+        aws_secret_access_key=secret_key,
+        endpoint_url=endpoint_url,
+        region_name=region_name,
+        config=Config(
+            # Room for concurrent uploads each running multipart threads
+            max_pool_connections=50,
+            retries={"max_attempts": 10, "mode": "adaptive"},
+            tcp_keepalive=True,
+        ),
+    )
+
+
+@functools.lru_cache(maxsize=8)
 def get_s3_client(
     access_key: Optional[str] = None,
     secret_key: Optional[str] = None,
@@ -339,6 +604,7 @@ def get_s3_client(
 ) -> S3Client:
     """
     Factory function to create and return an S3 client instance.
+    Clients are cached per distinct set of arguments.
 
     Args:
         access_key: AWS Access Key ID
@@ -350,16 +616,13 @@ def get_s3_client(
     Returns:
         Initialized S3Client instance
     """
-    global _s3_client
-    if _s3_client is None:
-        _s3_client = S3Client(
-            access_key=access_key,
-            secret_key=secret_key,
-            endpoint_url=endpoint_url,
-            bucket_name=bucket_name,
-            region_name=region_name,
-        )
-    return _s3_client
+    return S3Client(
+        access_key=access_key,
+        secret_key=secret_key,
+        endpoint_url=endpoint_url,
+        bucket_name=bucket_name,
+        region_name=region_name,
+    )
 
 
 def upload_file_to_s3(
@@ -385,7 +648,32 @@ def upload_file_to_s3(
         client.upload_file(file_path, s3_key, content_type)
         return True
     except Exception as e:
-        logger.error(f"Failed to upload file: {e}")
+        logger.error("Failed to upload file: %s", e)
+        return False
+
+
+def upload_fileobj_to_s3(
+    fileobj: BinaryIO,
+    s3_key: str,
+    content_type: Optional[str] = None,
+) -> bool:
+    """
+    Convenience function to upload a file object to S3 using the singleton client.
+
+    Args:
+        fileobj: Seekable file object opened in binary mode
+        s3_key: S3 object key (path in bucket)
+        content_type: Optional content type (MIME type)
+
+    Returns:
+        True if upload successful, False otherwise
+    """
+    try:
+        client = get_s3_client()
+        client.upload_fileobj(fileobj, s3_key, content_type)
+        return True
+    except Exception as e:
+        logger.error("Failed to upload file object: %s", e)
         return False
 
 
@@ -412,5 +700,5 @@ def upload_bytes_to_s3(
         client.upload_file_from_bytes(file_bytes, s3_key, content_type)
         return True
     except Exception as e:
-        logger.error(f"Failed to upload bytes: {e}")
+        logger.error("Failed to upload bytes: %s", e)
         return False
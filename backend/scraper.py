@@ -1,18 +1,61 @@
 from playwright.async_api import async_playwright, Page, Browser, BrowserContext
+import asyncio
 import re
+import tempfile
 from typing import Any
-import os
 import aiohttp
 import hashlib
 import uuid
+from yarl import URL
 
-from db.db_actions import add_or_update_course_with_sections, add_file
-from db.db import get_session
-from s3.s3_client import upload_file_to_s3
+from db.db_actions import add_or_update_course_with_sections, sync_course_files
+from db.db import session_scope
+from s3.s3_client import upload_fileobj_to_s3
 
 MOODLE_URL: str = "https://moodle.ucl.ac.uk"
-DOWNLOADS_DIR: str = "/tmp/moodle_downloads"
 PAGE_LOAD_TIMEOUT: int = 60000  # 60 seconds for page load
+DOWNLOAD_CONCURRENCY: int = 8  # Files downloaded at once per course
+DOWNLOAD_CHUNK_SIZE: int = 64 * 1024  # Bytes written per chunk while streaming
+SPOOL_MAX_SIZE: int = 10 * 1024 * 1024  # Larger downloads spill to a temp file
+MAX_COURSES: int = 5  # Courses scraped per run
+COURSE_PAGES: int = 4  # Courses scraped at once, one browser page each
+COURSE_LINK_SELECTOR: str = 'a[href*="/course/view.php?id="]'
+SECTION_SELECTOR: str = "li.section[data-sectionid], div.section"
+
+_COURSE_ID_RE = re.compile(r"id=(\d+)")
+_MODTYPE_RE = re.compile(r"modtype_(\w+)")
+
+# Extracts the raw section/module/resource tree of a course page. Names are
+# innerText (null when the element is missing); URLs are raw href attributes.
+_EXTRACT_SECTIONS_JS: str = """
+() => {
+    const text = (root, selector) => {
+        const element = root.querySelector(selector);
+        return element ? element.innerText : null;
+    };
+
+    // Use more specific selector to avoid duplicates
+    let sections = document.querySelectorAll("li.section[data-sectionid]");
+    if (sections.length === 0) {
+        // Fallback for different Moodle versions
+        sections = document.querySelectorAll("div.section");
+    }
+
+    return Array.from(sections, (section) => ({
+        name: text(section, ".sectionname, h3"),
+        modules: Array.from(section.querySelectorAll(".activity, .modtype_"), (module) => ({
+            name: text(module, ".instancename, span.instancename, a"),
+            class: module.getAttribute("class"),
+            url: module.querySelector("a")?.getAttribute("href") ?? null,
+            resources: Array.from(module.querySelectorAll(".fp-filename"), (resource) => ({
+                name: resource.innerText,
+                // The download link wraps the filename
+                url: resource.parentElement?.getAttribute("href") ?? null,
+            })),
+        })),
+    }));
+}
+"""
 
 
 async def fetch_all_available_courses(page: Page) -> list[str]:
@@ -23,31 +66,29 @@ async def fetch_all_available_courses(page: Page) -> list[str]:
         print(f"  ✗ Failed to navigate to courses page: {e}")
         return []
 
-    # Try networkidle first, fallback to domcontentloaded
+    # Wait for the course links themselves rather than for the network to go idle
     try:
-        await page.wait_for_load_state("networkidle", timeout=30000)
-    except Exception:
-        try:
-            await page.wait_for_load_state("domcontentloaded", timeout=10000)
-        except Exception as e:
-            print(f"  ⚠ Failed to wait for load state: {e}")
-
-    await page.wait_for_timeout(2000)
+        await page.wait_for_selector(COURSE_LINK_SELECTOR, timeout=15000)
+    except Exception as e:
+        print(f"  ⚠ Course links did not appear: {e}")
 
     all_courses: list[str] = []
     try:
-        links = await page.query_selector_all('a[href*="/course/view.php?id="]')
+        links = await page.query_selector_all(COURSE_LINK_SELECTOR)
 
-        for link in links[:5]:
+        # Dashboard cards link to a course more than once; keep the first
+        # MAX_COURSES distinct courses in page order
+        seen: set[str] = set()
+        for link in links:
             href: str | None = await link.get_attribute("href")
             if href:
-                if href.startswith("http"):
-                    all_courses.append(href)
-                else:
-                    all_courses.append(f"{MOODLE_URL}{href}")
+                url = href if href.startswith("http") else f"{MOODLE_URL}{href}"
+                if url not in seen:
+                    seen.add(url)
+                    all_courses.append(url)
+                    if len(all_courses) >= MAX_COURSES:
+                        break
 
-        # Remove duplicates
-        all_courses = list(set(all_courses))
         print(f"  ✓ Found {len(all_courses)} courses")
     except Exception as e:
         print(f"  ✗ Error extracting courses: {e}")
@@ -55,47 +96,52 @@ async def fetch_all_available_courses(page: Page) -> list[str]:
     return all_courses
 
 
-async def _download_file_from_url(
+def _file_s3_key(course_id: str, section_name: str, file_name: str) -> str:
+    """Build the S3 path of a course file"""
+    return f"courses/{course_id}/{section_name}/{file_name}"
+
+
+async def _download_to_s3(
+    session: aiohttp.ClientSession,
     file_url: str,
+    s3_key: str,
     filename: str,
-    cookies: dict[str, str] | None = None,
-) -> str | None:
+) -> bool:
     """
-    Download a file from a URL and save it locally.
+    Download a file from a URL and upload it to S3.
+
+    The body is buffered in memory, spilling to a temp file only past
+    SPOOL_MAX_SIZE, so the common small file never touches the disk.
 
     Args:
+        session: Shared HTTP session, carrying the Moodle cookies
         file_url: URL of the file to download
-        filename: Name to save the file as
-        cookies: Optional cookies dict for authentication
+        s3_key: S3 object key to upload the file to
+        filename: Name of the file, for logging
 
     Returns:
-        Local file path if successful, None otherwise
+        True if the file was downloaded and uploaded, False otherwise
     """
     try:
-        # Create downloads directory
-        os.makedirs(DOWNLOADS_DIR, exist_ok=True)
-
-        # Sanitize filename
-        safe_filename = "".join(
-            c for c in filename if c.isalnum() or c in (" ", "-", "_", ".")
-        )
-        file_path = os.path.join(DOWNLOADS_DIR, safe_filename)
-
-        # Download file
-        async with aiohttp.ClientSession() as session:
-            async with session.get(file_url, cookies=cookies) as response:
-                if response.status == 200:
-                    with open(file_path, "wb") as f:
-                        f.write(await response.read())
-                    return file_path
-                else:
+        with tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE) as buffer:
+            async with session.get(file_url) as response:
+                if response.status != 200:
                     print(
                         f"      ✗ Failed to download {filename}: HTTP {response.status}"
                     )
-                    return None
+                    return False
+                async for chunk in response.content.iter_chunked(DOWNLOAD_CHUNK_SIZE):
+                    buffer.write(chunk)
+
+            buffer.seek(0)
+            # boto3 is blocking, so upload from a worker thread
+            if await asyncio.to_thread(upload_fileobj_to_s3, buffer, s3_key):
+                return True
+            print(f"      ✗ Failed to upload {filename} to S3")
+            return False
     except Exception as e:
         print(f"      ✗ Error downloading {filename}: {e}")
-        return None
+        return False
 
 
 def _build_section_markdown_content(modules: list[dict[str, Any]]) -> str:
@@ -146,7 +192,7 @@ def _save_course_to_database(
     sections_data: list[dict[str, Any]],
 ) -> None:
     """
-    Save scraped course data to the database and upload files to S3.
+    Save scraped course data and the metadata of its files to the database.
 
     Args:
         course_id: Unique course identifier
@@ -154,109 +200,98 @@ def _save_course_to_database(
         user_id: ID of the user who owns this course
         sections_data: List of section data with modules and files
     """
-    session = get_session()
-
     try:
-        # Prepare sections for database
-        db_sections: list[dict[str, Any]] = []
-
-        for idx, section in enumerate(sections_data):
-            section_name = section.get("name", "")
-            modules = section.get("modules", [])
-
-            # Skip sections with no modules
-            if not modules:
-                continue
-
-            # Build markdown content from modules
-            markdown_content = _build_section_markdown_content(modules)
-
-            # Create unique sectionId using section name hash to avoid duplicates
-            section_name_hash = hashlib.md5(section_name.encode()).hexdigest()[:8]
-            section_id = f"{course_id}_section_{section_name_hash}"
-
-            db_sections.append(
-                {
-                    "sectionId": section_id,
-                    "title": section_name,
-                    "content": markdown_content,
-                }
-            )
-
-        # Add or update course with sections to database
-        course = add_or_update_course_with_sections(
-            userId=user_id,
-            courseId=course_id,
-            courseName=course_name,
-            sections_data=db_sections,
-        )
+        with session_scope() as session:
+            # Prepare sections and their files for database in one pass
+            db_sections: list[dict[str, Any]] = []
+            files: list[dict[str, Any]] = []
+            # Keys of every file still on the course page, uploaded or not
+            file_keys: list[str] = []
+
+            for section in sections_data:
+                section_name = section.get("name", "")
+                modules = section.get("modules", [])
+
+                # Skip sections with no modules
+                if not modules:
+                    continue
 
-        if course:
-            print(
-                f"    ✓ Course '{course_name}' saved to database with {len(db_sections)} sections"
-            )
+                # Build markdown content from modules
+                markdown_content = _build_section_markdown_content(modules)
 
-            # Save files for each section and upload to S3
-            for idx, section in enumerate(sections_data):
-                section_name = section.get("name", "unnamed_section")
-                # Recreate the same sectionId using the hash to match what was saved
+                # Create unique sectionId using section name hash to avoid duplicates
                 section_name_hash = hashlib.md5(section_name.encode()).hexdigest()[:8]
                 section_id = f"{course_id}_section_{section_name_hash}"
 
-                for module in section.get("modules", []):
+                db_sections.append(
+                    {
+                        "sectionId": section_id,
+                        "title": section_name,
+                        "content": markdown_content,
+                    }
+                )
+
+                for module in modules:
                     for resource in module.get("resources", []):
                         file_name = resource.get("filename", "Unknown File")
                         # Generate a simple key from file name
                         file_key = f"{course_id}_{file_name.replace(' ', '_').replace('.', '_').lower()}"
-
-                        # Build S3 path for the file
-                        s3_key = f"courses/{course_id}/{section_name}/{file_name}"
-
-                        # Check if file exists locally (if it was downloaded)
-                        local_file_path = resource.get("local_path")
-                        uploaded_to_s3 = False
-
-                        if local_file_path and os.path.exists(local_file_path):
-                            # Upload file to S3
-                            try:
-                                success = upload_file_to_s3(
-                                    file_path=local_file_path,
-                                    s3_key=s3_key,
-                                    content_type=resource.get("content_type"),
-                                )
-                                if success:
-                                    uploaded_to_s3 = True
-                                else:
-                                    print(f"      ✗ Failed to upload {file_name} to S3")
-                            except Exception as e:
-                                print(f"      ✗ Error uploading {file_name} to S3: {e}")
-
-                        # Use S3 path if uploaded, otherwise use local path
-                        file_path = (
-                            s3_key
-                            if uploaded_to_s3
-                            else f"local://{local_file_path}"
-                            if local_file_path
-                            else s3_key
+                        file_keys.append(file_key)
+
+                        # Only record files that made it to S3, so every row
+                        # points at an existing object
+                        if not resource.get("uploaded_to_s3"):
+                            continue
+                        files.append(
+                            {
+                                "file_name": file_name,
+                                "file_key": file_key,
+                                # Build S3 path for the file
+                                "s3_key": _file_s3_key(
+                                    course_id,
+                                    section.get("name", "unnamed_section"),
+                                    file_name,
+                                ),
+                                "section_id": section_id,
+                            }
                         )
 
-                        # Save file metadata to database with S3 path
-                        add_file(
-                            path=file_path,
-                            key=file_key,
-                            courseId=course_id,
-                            sectionId=section_id,
-                            session=session,
-                        )
+            # Add or update course with sections to database
+            course = add_or_update_course_with_sections(
+                userId=user_id,
+                courseId=course_id,
+                courseName=course_name,
+                sections_data=db_sections,
+            )
+
+            if course:
+                print(
+                    f"    ✓ Course '{course_name}' saved to database with {len(db_sections)} sections"
+                )
+
+                # Uploaded files went to S3 while downloading; record their paths
+                file_rows: list[dict[str, Any]] = [
+                    {
+                        "path": file["s3_key"],
+                        "key": file["file_key"],
+                        "courseId": course_id,
+                        "sectionId": file["section_id"],
+                    }
+                    for file in files
+                ]
+
+                # Save file metadata to database with S3 paths in one batch,
+                # dropping files that are no longer on the course page
+                sync_course_files(
+                    course_id, file_rows, keys=file_keys, session=session
+                )
 
-            print(f"    ✓ File metadata and S3 paths saved to database")
-        else:
-            print(f"    ✗ Failed to save course '{course_name}' to database")
+                print(f"    ✓ File metadata and S3 paths saved to database")
+            else:
+                print(f"    ✗ Failed to save course '{course_name}' to database")
 
     except Exception as e:
         print(f"    ✗ Error saving course to database: {e}")
-    finally:
-        session.close()
 
 
 async def scrape_course_details(
@@ -277,15 +312,13 @@ async def scrape_course_details(
             "total_modules": 0,
         }
 
-    # Wait for page to stabilize
+    # Wait until the course sections are rendered
     try:
-        await page.wait_for_load_state("domcontentloaded", timeout=10000)
+        await page.wait_for_selector(SECTION_SELECTOR, timeout=10000)
     except Exception as e:
-        print(f"  ⚠ Load state timeout: {e}")
+        print(f"  ⚠ Sections did not appear: {e}")
 
-    await page.wait_for_timeout(1500)
-
-    course_id_match = re.search(r"id=(\d+)", course_url)
+    course_id_match = _COURSE_ID_RE.search(course_url)
     course_id: str = str(course_id_match.group(1)) if course_id_match else "unknown"
 
     course_name: str = await page.title()
@@ -298,25 +331,16 @@ async def scrape_course_details(
         "total_modules": 0,
     }
 
-    # Use more specific selector to avoid duplicates
-    sections = await page.query_selector_all("li.section[data-sectionid]")
-
-    if not sections:
-        # Fallback for different Moodle versions
-        sections = await page.query_selector_all("div.section")
+    # Read every section, module and resource in one round trip to the browser
+    sections: list[dict[str, Any]] = await page.evaluate(_EXTRACT_SECTIONS_JS)
 
     seen_sections: set[str] = set()
 
-    for section_element in sections:
-        section_name_element = await section_element.query_selector(".sectionname, h3")
-        section_name: str = (
-            (await section_name_element.inner_text()).strip()
-            if section_name_element
-            else ""
-        )
+    for section in sections:
+        section_name: str = (section["name"] or "").strip()
 
         # Skip empty section names to avoid duplicates
-        if not section_name or section_name.strip() == "":
+        if not section_name:
             continue
 
         # Skip if we've already processed this section
@@ -330,43 +354,26 @@ async def scrape_course_details(
             "modules": [],
         }
 
-        modules = await section_element.query_selector_all(".activity, .modtype_")
-        for module_element in modules:
-            mod_name_element = await module_element.query_selector(
-                ".instancename, span.instancename, a"
-            )
+        for module in section["modules"]:
             mod_name: str = (
-                (await mod_name_element.inner_text()).strip()
-                if mod_name_element
+                module["name"].strip()
+                if module["name"] is not None
                 else "Unnamed Module"
             )
 
-            mod_class: str = await module_element.get_attribute("class") or ""
-            mod_type_match = re.search(r"modtype_(\w+)", mod_class)
+            mod_type_match = _MODTYPE_RE.search(module["class"] or "")
             mod_type: str = mod_type_match.group(1) if mod_type_match else "unknown"
 
-            mod_url_element = await module_element.query_selector("a")
-            mod_url: str | None = (
-                await mod_url_element.get_attribute("href") if mod_url_element else None
-            )
-
             resources: list[dict[str, Any]] = []
-            resource_elements = await module_element.query_selector_all(".fp-filename")
-            for resource_element in resource_elements:
-                file_name: str = (await resource_element.inner_text()).strip()
+            for resource in module["resources"]:
+                file_name: str = resource["name"].strip()
                 if file_name:
-                    # Try to get download link
-                    file_link_element = await resource_element.query_selector("..")
-                    file_url: str | None = None
-                    if file_link_element:
-                        file_url = await file_link_element.get_attribute("href")
-
                     resources.append(
                         {
                             "filename": file_name,
                             "type": "file",
-                            "url": file_url,
-                            "local_path": None,
+                            "url": resource["url"],
+                            "uploaded_to_s3": False,
                             "content_type": None,
                         }
                     )
@@ -376,7 +383,7 @@ async def scrape_course_details(
                     {
                         "name": mod_name,
                         "type": mod_type,
-                        "url": mod_url,
+                        "url": module["url"],
                         "resources": resources,
                     }
                 )
@@ -387,23 +394,48 @@ async def scrape_course_details(
 
     print(f"    ✓ Found {course_data['total_modules']} modules/activities")
 
-    # Download files and prepare for S3 upload
+    # Download files and stream them to S3
     print(f"  Downloading files...")
-    for section in course_data["sections"]:
-        for module in section["modules"]:
-            for resource in module["resources"]:
-                if resource.get("url"):
-                    # Download file
-                    local_path = await _download_file_from_url(
-                        file_url=resource["url"],
-                        filename=resource["filename"],
-                    )
-                    if local_path:
-                        resource["local_path"] = local_path
-                        print(f"    ✓ Downloaded {resource['filename']}")
+    # One pooled session for every download, authenticated with the browser's cookies
+    cookies: dict[str, str] = {
+        cookie["name"]: cookie["value"] for cookie in await page.context.cookies()
+    }
+    async with aiohttp.ClientSession(
+        connector=aiohttp.TCPConnector(limit=32, limit_per_host=16, ttl_dns_cache=300),
+    ) as session:
+        # Scope the cookies to Moodle; passed to ClientSession they would have no
+        # domain and be sent to any host a download redirects to
+        session.cookie_jar.update_cookies(cookies, response_url=URL(MOODLE_URL))
+        semaphore = asyncio.Semaphore(DOWNLOAD_CONCURRENCY)
+
+        async def _download(section_name: str, resource: dict[str, Any]) -> None:
+            # Held through the upload too, which bounds the buffered bytes
+            async with semaphore:
+                uploaded = await _download_to_s3(
+                    session=session,
+                    file_url=resource["url"],
+                    s3_key=_file_s3_key(course_id, section_name, resource["filename"]),
+                    filename=resource["filename"],
+                )
+            if uploaded:
+                resource["uploaded_to_s3"] = True
+                print(f"    ✓ Downloaded {resource['filename']}")
+
+        await asyncio.gather(
+            *(
+                _download(section["name"], resource)
+                for section in course_data["sections"]
+                for module in section["modules"]
+                for resource in module["resources"]
+                if resource.get("url")
+            ),
+            return_exceptions=True,
+        )
 
-    # Save to database and upload to S3
-    _save_course_to_database(
+    # Save to database off the event loop, so other courses keep loading
+    # meanwhile
+    await asyncio.to_thread(
+        _save_course_to_database,
         course_id=course_id,
         course_name=course_name,
         user_id=user_id,
@@ -414,30 +446,61 @@ async def scrape_course_details(
 
 
 async def scrape(
-    cookies: list[dict[str, Any]], user_id: uuid.UUID | str = "default_user"
+    cookies: list[dict[str, Any]],
+    user_id: uuid.UUID | str = "default_user",
+    browser: Browser | None = None,
 ) -> None:
-    """Main function to orchestrate the scraping process."""
-    async with async_playwright() as p:
-        browser: Browser = await p.chromium.launch()
-        context: BrowserContext = await browser.new_context(
-            user_agent="Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/109.0.0.0 Safari/537.36",
-        )
-        page: Page = await context.new_page()
+    """
+    Main function to orchestrate the scraping process.
 
-        await context.add_cookies(cookies)
-        print("Adding cookies")
+    Pass a long-lived browser to reuse it across calls; each call then only
+    opens its own context, which keeps users' cookies apart. Without one, a
+    browser is launched for this call and closed afterwards.
+    """
+    if browser is None:
+        async with async_playwright() as p:
+            browser = await p.chromium.launch()
+            try:
+                await _scrape_with_browser(browser, cookies, user_id)
+            finally:
+                await browser.close()
+        return
+
+    await _scrape_with_browser(browser, cookies, user_id)
+
+
+async def _scrape_with_browser(
+    browser: Browser,
+    cookies: list[dict[str, Any]],
+    user_id: uuid.UUID | str,
+) -> None:
+    """Scrape all courses in a fresh context of the given browser."""
+    context: BrowserContext = await browser.new_context(
+        user_agent="Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/109.0.0.0 Safari/537.36",
+    )
+    page: Page = await context.new_page()
 
-        try:
-            course_urls: list[str] = await fetch_all_available_courses(page)
+    await context.add_cookies(cookies)
+    print("Adding cookies")
 
-            detailed_courses: list[dict[str, Any]] = []
-            for idx, url in enumerate(course_urls, 1):
+    try:
+        course_urls: list[str] = await fetch_all_available_courses(page)
+
+        # Scrape up to COURSE_PAGES courses at once, each worker on its own page
+        pages: list[Page] = [page] + [
+            await context.new_page()
+            for _ in range(min(COURSE_PAGES, len(course_urls)) - 1)
+        ]
+        pending = iter(enumerate(course_urls, 1))
+        detailed_courses: list[dict[str, Any]] = []
+
+        async def _worker(worker_page: Page) -> None:
+            # Workers share one iterator, so each course is taken exactly once
+            for idx, url in pending:
                 try:
-                    print(
-                        f"\n  Scraping course {idx}/{min(2, len(course_urls))}: {url}"
-                    )
+                    print(f"\n  Scraping course {idx}/{len(course_urls)}: {url}")
                     details: dict[str, Any] = await scrape_course_details(
-                        url, page, user_id
+                        url, worker_page, user_id
                     )
                     detailed_courses.append(details)
                 except Exception as course_error:
@@ -447,9 +510,11 @@ async def scrape(
                     traceback.print_exc()
                     continue
 
-        except Exception as e:
-            import traceback
+        await asyncio.gather(*(_worker(worker_page) for worker_page in pages))
 
-            traceback.print_exc()
-        finally:
-            await browser.close()
+    except Exception as e:
+        import traceback
+
+        traceback.print_exc()
+    finally:
+        await context.close()
@@ -0,0 +1,197 @@
+"""
+Database tests. They need a PostgreSQL database with the schema applied
+(the frontend's drizzle migrations) and DATABASE_URL pointing at it.
+
+Run from backend/:  python -m unittest discover tests
+"""
+
+import os
+import unittest
+import uuid
+
+from sqlalchemy import delete, select
+
+if not os.getenv("DATABASE_URL"):
+    raise unittest.SkipTest("DATABASE_URL is not set")
+
+from db.db import session_scope
+from db.db_actions import (
+    add_files_bulk,
+    add_or_update_course_with_sections,
+    add_user,
+    bulk_sync_courses,
+    sync_course_files,
+)
+from db.models import Course, File, Section, User
+
+
+class CourseTestCase(unittest.TestCase):
+    """Creates a user and a course id per test and removes their rows after"""
+
+    def setUp(self) -> None:
+        self.courseId = f"test-{uuid.uuid4().hex[:12]}"
+        with session_scope() as session:
+            user = add_user(f"{self.courseId}@example.com", "x", session=session)
+            self.userId = user.id
+
+    def tearDown(self) -> None:
+        with session_scope() as session:
+            session.execute(delete(File).where(File.courseId == self.courseId))
+            session.execute(delete(Section).where(Section.courseId == self.courseId))
+            session.execute(delete(Course).where(Course.courseId == self.courseId))
+            session.execute(delete(User).where(User.id == self.userId))
+
+    def _sync(self, *section_ids: str) -> Course | None:
+        return add_or_update_course_with_sections(
+            self.userId,
+            self.courseId,
+            "Test course",
+            [{"sectionId": f"{self.courseId}_{s}", "title": s} for s in section_ids],
+        )
+
+    def _add_file(self, section: str, name: str) -> None:
+        with session_scope() as session:
+            add_files_bulk(
+                [
+                    {
+                        "path": f"courses/{self.courseId}/{section}/{name}",
+                        "key": f"{self.courseId}_{name}",
+                        "courseId": self.courseId,
+                        "sectionId": f"{self.courseId}_{section}",
+                    }
+                ],
+                session=session,
+            )
+
+    def _stored(self, model, column) -> list[str]:
+        with session_scope() as session:
+            return sorted(
+                session.scalars(
+                    select(column).where(model.courseId == self.courseId)
+                ).all()
+            )
+
+
+class AddOrUpdateCourseWithSectionsTest(CourseTestCase):
+    def test_resync_drops_removed_section_with_its_files(self) -> None:
+        self.assertIsNotNone(self._sync("week1", "week2"))
+        self._add_file("week1", "a.pdf")
+        self._add_file("week2", "b.pdf")
+
+        # week2 disappeared from Moodle but still has a file pointing at it
+        self.assertIsNotNone(self._sync("week1"))
+
+        self.assertEqual(
+            self._stored(Section, Section.sectionId), [f"{self.courseId}_week1"]
+        )
+        self.assertEqual(
+            self._stored(File, File.path), [f"courses/{self.courseId}/week1/a.pdf"]
+        )
+
+    def test_resync_keeps_files_of_unchanged_sections(self) -> None:
+        self.assertIsNotNone(self._sync("week1"))
+        self._add_file("week1", "a.pdf")
+
+        self.assertIsNotNone(self._sync("week1", "week2"))
+
+        self.assertEqual(
+            self._stored(File, File.path), [f"courses/{self.courseId}/week1/a.pdf"]
+        )
+
+
+class SyncCourseFilesTest(CourseTestCase):
+    def _file_row(self, section: str, name: str) -> dict:
+        return {
+            "path": f"courses/{self.courseId}/{section}/{name}",
+            "key": f"{self.courseId}_{name}",
+            "sectionId": f"{self.courseId}_{section}",
+        }
+
+    def _sync_files(self, rows: list[dict], keys: list[str] | None = None) -> None:
+        with session_scope() as session:
+            sync_course_files(self.courseId, rows, keys=keys, session=session)
+
+    def _stored_files(self) -> list[tuple[str, str]]:
+        with session_scope() as session:
+            return sorted(
+                session.execute(
+                    select(File.path, File.sectionId).where(
+                        File.courseId == self.courseId
+                    )
+                ).all()
+            )
+
+    def test_removed_and_moved_files(self) -> None:
+        self._sync("week1", "week2")
+        self._sync_files(
+            [self._file_row("week1", "a.pdf"), self._file_row("week1", "b.pdf")]
+        )
+
+        # b.pdf was removed from the page and a.pdf moved to week2
+        self._sync_files([self._file_row("week2", "a.pdf")])
+
+        self.assertEqual(
+            self._stored_files(),
+            [(f"courses/{self.courseId}/week2/a.pdf", f"{self.courseId}_week2")],
+        )
+
+    def test_keys_keep_files_left_out_of_rows(self) -> None:
+        self._sync("week1")
+        self._sync_files(
+            [self._file_row("week1", "a.pdf"), self._file_row("week1", "b.pdf")]
+        )
+
+        # b.pdf is still on the page but its upload failed this time
+        self._sync_files(
+            [self._file_row("week1", "a.pdf")],
+            keys=[f"{self.courseId}_a.pdf", f"{self.courseId}_b.pdf"],
+        )
+
+        self.assertEqual(
+            self._stored(File, File.path),
+            [
+                f"courses/{self.courseId}/week1/a.pdf",
+                f"courses/{self.courseId}/week1/b.pdf",
+            ],
+        )
+
+
+class BulkSyncCoursesTest(AddOrUpdateCourseWithSectionsTest):
+    """Runs the same scenarios through bulk_sync_courses"""
+
+    def _sync(self, *section_ids: str) -> list[Course] | None:
+        return bulk_sync_courses(
+            self.userId,
+            [
+                {
+                    "courseId": self.courseId,
+                    "courseName": "Test course",
+                    "sections": [
+                        {"sectionId": f"{self.courseId}_{s}", "title": s}
+                        for s in section_ids
+                    ],
+                }
+            ],
+        )
+
+    def test_duplicate_course_ids_in_one_batch(self) -> None:
+        synced = bulk_sync_courses(
+            self.userId,
+            [
+                {"courseId": self.courseId, "courseName": "Old name"},
+                {
+                    "courseId": self.courseId,
+                    "courseName": "New name",
+                    "sections": [{"sectionId": f"{self.courseId}_week1"}],
+                },
+            ],
+        )
+
+        self.assertEqual([c.courseName for c in synced], ["New name"])
+        self.assertEqual(
+            self._stored(Section, Section.sectionId), [f"{self.courseId}_week1"]
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
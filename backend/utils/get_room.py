@@ -1,16 +1,20 @@
-import requests
-from requests import Response
+import httpx
+from httpx import Response
 import os
-from dotenv import load_dotenv
-
-load_dotenv()
-
-client_secret = os.getenv("CLIENT_SECRET")
-client_id = os.getenv("CLIENT_ID")
+try:
+    from utils.uclapi import build_params, cache_get, cache_put, client as uclapi_client
+except ModuleNotFoundError:
+    # Run as a script (python utils/get_room.py), with utils/ on sys.path
+    from uclapi import build_params, cache_get, cache_put, client as uclapi_client
 
 
 def get_free_rooms(start_datetime, end_datetime, token):
 
+    key = ("freerooms", start_datetime, end_datetime, token)
+    data = cache_get(key)
+    if data is not None:
+        return data
+
     # Base URL for geocoding API
     url: str = "https://uclapi.com/roombookings/freerooms"
 
@@ -19,17 +23,16 @@ def get_free_rooms(start_datetime, end_datetime, token):
     "start_datetime": start_datetime,
     "end_datetime": end_datetime,
     "token": token,
-    "client_id": client_id,
-    "client_secret": client_secret
     }
 
     # Make the GET request
-    response: Response = requests.get(url, params=params)
+    response: Response = uclapi_client.get(url, params=build_params(params))
 
     # Check the response is OK and parse the JSON data
 
     if response.status_code == 200:
         data: dict = response.json()
+        cache_put(key, data)
     
         return data
     
@@ -38,6 +41,36 @@ def get_free_rooms(start_datetime, end_datetime, token):
         print(f"Error: {error_message}")
         return None
 
+
+async def get_free_rooms_async(start_datetime, end_datetime, token, client: httpx.AsyncClient):
+    """Async variant of get_free_rooms using the caller's httpx client"""
+
+    key = ("freerooms", start_datetime, end_datetime, token)
+    data = cache_get(key)
+    if data is not None:
+        return data
+
+    url: str = "https://uclapi.com/roombookings/freerooms"
+
+    params: dict = {
+    "start_datetime": start_datetime,
+    "end_datetime": end_datetime,
+    "token": token,
+    }
+
+    response: Response = await client.get(url, params=build_params(params), timeout=10.0)
+
+    if response.status_code == 200:
+        data: dict = response.json()
+        cache_put(key, data)
+
+        return data
+
+    else:
+        error_message: dict = response.json()
+        print(f"Error: {error_message}")
+        return None
+
 def main():
     TOKEN = os.getenv("TOKEN")
     start_time = "2025-11-07T00:00:00Z"
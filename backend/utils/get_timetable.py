@@ -1,30 +1,33 @@
-import requests
-from requests import Response
+import httpx
+from httpx import Response
 import os
-from dotenv import load_dotenv
-
-load_dotenv()
-
-client_secret = os.getenv("CLIENT_SECRET")
-client_id = os.getenv("CLIENT_ID")
+try:
+    from utils.uclapi import build_params, cache_get, cache_put, client as uclapi_client
+except ModuleNotFoundError:
+    # Run as a script (python utils/get_timetable.py), with utils/ on sys.path
+    from uclapi import build_params, cache_get, cache_put, client as uclapi_client
 
 """Returns personal timetable filtered by date(OPTIONAL) in YYYY-MM-DD"""
 def get_personal_timetable(token, date = ""):
 
+    key = ("timetable", token, date)
+    data = cache_get(key)
+    if data is not None:
+        return data
+
     url: str = "https://uclapi.com/timetable/personal"
     params: dict = {
     "date": date,
     "token": token,
-    "client_id": client_id,
-    "client_secret": client_secret
     }
 
     # Make the GET request
-    response: Response = requests.get(url, params=params)
+    response: Response = uclapi_client.get(url, params=build_params(params))
 
     # Check the response is OK and parse the JSON data
     if response.status_code == 200:
         data: dict = response.json()
+        cache_put(key, data)
     
         return data
 
@@ -33,6 +36,34 @@ def get_personal_timetable(token, date = ""):
         print(f"Error: {error_message}")
         return None
 
+
+async def get_personal_timetable_async(token, client: httpx.AsyncClient, date = ""):
+    """Async variant of get_personal_timetable using the caller's httpx client"""
+
+    key = ("timetable", token, date)
+    data = cache_get(key)
+    if data is not None:
+        return data
+
+    url: str = "https://uclapi.com/timetable/personal"
+    params: dict = {
+    "date": date,
+    "token": token,
+    }
+
+    response: Response = await client.get(url, params=build_params(params), timeout=10.0)
+
+    if response.status_code == 200:
+        data: dict = response.json()
+        cache_put(key, data)
+
+        return data
+
+    else:
+        error_message: dict = response.json()
+        print(f"Error: {error_message}")
+        return None
+
 def main():
     TOKEN = os.getenv("TOKEN")
     data = get_personal_timetable(TOKEN)
@@ -0,0 +1,49 @@
+"""Shared HTTP client, credentials and response cache for UCL API calls"""
+
+import os
+import threading
+import httpx
+from cachetools import TTLCache
+from dotenv import load_dotenv
+
+load_dotenv()
+
+client_secret = os.getenv("CLIENT_SECRET")
+client_id = os.getenv("CLIENT_ID")
+
+# App credentials sent with every request, built once
+BASE_PARAMS: dict = {"client_id": client_id, "client_secret": client_secret}
+
+# One HTTP/2 connection to UCL API shared by every module; requests multiplex on it
+client = httpx.Client(
+    transport=httpx.HTTPTransport(
+        http2=True,
+        retries=3,
+        limits=httpx.Limits(max_connections=20, max_keepalive_connections=8),
+    ),
+    timeout=10.0,
+)
+
+# UCL API answers change slowly, so they are reused for 5 minutes per query.
+# Keys start with the endpoint name. Failed lookups (None) are not cached,
+# so the next call retries.
+_cache: TTLCache = TTLCache(maxsize=512, ttl=300)
+_cache_lock = threading.Lock()
+
+
+def build_params(params: dict) -> dict:
+    """Add the app credentials to a call's params, leaving out unset values"""
+    # requests used to drop None values; httpx would send them as empty strings
+    return {
+        key: value for key, value in (BASE_PARAMS | params).items() if value is not None
+    }
+
+
+def cache_get(key: tuple):
+    with _cache_lock:
+        return _cache.get(key)
+
+
+def cache_put(key: tuple, data: dict) -> None:
+    with _cache_lock:
+        _cache[key] = data
@@ -0,0 +1,3 @@
+CREATE INDEX "ix_section_courseId" ON "Section" USING btree ("courseId");--> statement-breakpoint
+CREATE INDEX "ix_file_courseId" ON "File" USING btree ("courseId");--> statement-breakpoint
+CREATE INDEX "ix_file_sectionId" ON "File" USING btree ("sectionId");
\ No newline at end of file
@@ -9,6 +9,7 @@ import {
 	primaryKey,
 	foreignKey,
 	boolean,
+	index,
 	uniqueIndex
 } from 'drizzle-orm/pg-core';
 
@@ -171,6 +172,7 @@ export const section = pgTable(
 			.defaultNow()
 	},
 	(table) => [
+		index('ix_section_courseId').on(table.courseId),
 		{
 			courseIdIdx: foreignKey({
 				columns: [table.courseId],
@@ -199,6 +201,8 @@ export const file = pgTable(
 			.defaultNow()
 	},
 	(table) => [
+		index('ix_file_courseId').on(table.courseId),
+		index('ix_file_sectionId').on(table.sectionId),
 		{
 			courseIdIdx: foreignKey({
 				columns: [table.courseId],
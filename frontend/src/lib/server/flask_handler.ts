@@ -9,6 +9,22 @@ import { POSTGRES_URL } from '$env/static/private';
 const client = postgres(POSTGRES_URL);
 const database = drizzle(client);
 
+const SCRAPE_POLL_INTERVAL_MS = 2000;
+
+// The backend runs the scrape as a background job; poll until it finishes
+async function wait_for_scrape(jobId: string): Promise<{ status: string; error?: string }> {
+	while (true) {
+		const response = await fetch(`${VITE_FLASK_BACKEND_URL}/scrape/${jobId}`);
+		const data = await response.json();
+
+		if (data.status !== 'running') {
+			return data;
+		}
+
+		await new Promise((resolve) => setTimeout(resolve, SCRAPE_POLL_INTERVAL_MS));
+	}
+}
+
 export async function sync_moodle(userId: string): Promise<void> {
 	try {
 		const response = await fetch(`${VITE_FLASK_BACKEND_URL}/scrape`, {
@@ -19,7 +35,8 @@ export async function sync_moodle(userId: string): Promise<void> {
 			body: JSON.stringify({ user_id: userId })
 		});
 
-		const data = await response.json();
+		const accepted = await response.json();
+		const data = accepted.job_id ? await wait_for_scrape(accepted.job_id) : accepted;
 
 		if (data.status === 'success') {
 			await database.update(user).set({ last_moodle_sync: new Date() }).where(eq(user.id, userId));